@@ -11,6 +11,7 @@ import os
 import re
 import tempfile
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
 
 import requests
 from mozpack import mozjar
@@ -19,6 +20,7 @@ from requests_hawk import HawkAuth
 from iscript.constants import LANGPACK_AUTOGRAPH_KEY_ID, OMNIJA_AUTOGRAPH_KEY_ID
 from iscript.createprecomplete import generate_precomplete
 from iscript.exceptions import IScriptError
+from iscript.util import iter_files
 from scriptworker_client.aio import raise_future_exceptions, retry_async
 from scriptworker_client.utils import makedirs, rm
 
@@ -381,31 +383,37 @@ async def sign_omnija_with_autograph(config, sign_config, app_path, fmt):
 
     """
     log.info(f"Signing omnija in {app_path}...")
-    all_files = []
-    for top_dir, dirs, files in os.walk(app_path):
-        for file_ in files:
-            all_files.append(os.path.join(top_dir, file_))
-    files_to_sign = _get_omnija_signing_files(all_files)
-    for from_ in files_to_sign:
-        signed_out = tempfile.mkstemp(prefix="oj_signed", suffix=".ja", dir=config["work_dir"])[1]
-        merged_out = tempfile.mkstemp(prefix="oj_merged", suffix=".ja", dir=config["work_dir"])[1]
-
-        await sign_file_with_autograph(
-            sign_config,
-            from_,
-            fmt,
-            to=signed_out,
-            keyid=OMNIJA_AUTOGRAPH_KEY_ID[sign_config.get("release_type", "dep")],
-            extension_id="omni.ja@mozilla.org",
-        )
-        await merge_omnija_files(orig=from_, signed=signed_out, to=merged_out)
-        with open(from_, "wb") as fout:
-            with open(merged_out, "rb") as fin:
-                fout.write(fin.read())
+    files_to_sign = _get_omnija_signing_files(iter_files(app_path))
+    # Share one worker process across this app's omni.ja merges.
+    executor = ProcessPoolExecutor(max_workers=1)
+    try:
+        for from_ in files_to_sign:
+            signed_out = tempfile.mkstemp(prefix="oj_signed", suffix=".ja", dir=config["work_dir"])[1]
+            merged_out = tempfile.mkstemp(prefix="oj_merged", suffix=".ja", dir=config["work_dir"])[1]
+
+            await sign_file_with_autograph(
+                sign_config,
+                from_,
+                fmt,
+                to=signed_out,
+                keyid=OMNIJA_AUTOGRAPH_KEY_ID[sign_config.get("release_type", "dep")],
+                extension_id="omni.ja@mozilla.org",
+            )
+            await merge_omnija_files(orig=from_, signed=signed_out, to=merged_out, executor=executor)
+            with open(from_, "wb") as fout:
+                with open(merged_out, "rb") as fin:
+                    fout.write(fin.read())
+    finally:
+        await _shutdown_executor(executor)
     return files_to_sign
 
 
-async def merge_omnija_files(orig, signed, to):
+async def _shutdown_executor(executor):
+    # ``shutdown(wait=True)`` joins the worker, so run it off the event loop thread
+    await asyncio.get_running_loop().run_in_executor(None, executor.shutdown)
+
+
+async def merge_omnija_files(orig, signed, to, executor=None):
     """Merge multiple omnijar files together.
 
     This takes the original file, and reads it in, including performance
@@ -413,15 +421,33 @@ async def merge_omnija_files(orig, signed, to):
     then adds data from the "signed" copy (the META-INF folder)
     and finally writes it all out to a new omni.ja file.
 
+    Rewriting the jar is CPU-bound pure Python, so we do it in a separate
+    process. That way, merges for multiple apps can run in parallel,
+    and the event loop stays free for the other signing subprocesses.
+
     Args:
         orig (str): the source file to sign
         signed (str): the signed file, without optimizations
         to (str): the output path for the merge
+        executor (concurrent.futures.Executor, optional): the executor to
+            merge in. If None, use a single-use ``ProcessPoolExecutor``.
+            Defaults to None.
 
     Returns:
         bool: always True if function succeeded.
 
     """
+    loop = asyncio.get_running_loop()
+    if executor is not None:
+        return await loop.run_in_executor(executor, _merge_omnija_files, orig, signed, to)
+    executor = ProcessPoolExecutor(max_workers=1)
+    try:
+        return await loop.run_in_executor(executor, _merge_omnija_files, orig, signed, to)
+    finally:
+        await _shutdown_executor(executor)
+
+
+def _merge_omnija_files(orig, signed, to):
     orig_jarreader = mozjar.JarReader(orig)
     with mozjar.JarWriter(to, compress=orig_jarreader.compression) as to_writer:
         for origjarfile in orig_jarreader:
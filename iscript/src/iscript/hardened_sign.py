@@ -73,6 +73,8 @@ async def download_signing_resources(hardened_sign_config, folder: Path):
 
 
 def check_globs(app_path, globs):
+    """Expands globs relative to app_path, warning on any that match nothing"""
+    paths = {}
     for path_glob in globs:
         separator = ""
         if not path_glob.startswith("/"):
@@ -81,6 +83,8 @@ def check_globs(app_path, globs):
         binary_paths = glob(joined_path, recursive=True)
         if len(binary_paths) == 0:
             log.warning('file pattern "%s" matches no files' % joined_path)
+        paths.update(dict.fromkeys(binary_paths))
+    return list(paths)
 
 
 def copy_provisioning_profile(pprofile, app_path, config):
@@ -143,14 +147,7 @@ def build_sign_command(app_path, identity, keychain, config, file_map):
         cmd.append("--entitlements")
         cmd.append(file_map[config["entitlements"]])
     # List globs
-    for path_glob in config["globs"]:
-        separator = ""
-        if not path_glob.startswith("/"):
-            separator = "/"
-        # Join incoming glob with root of app path
-        full_path_glob = str(app_path) + separator + path_glob
-        for binary_path in glob(full_path_glob, recursive=True):
-            cmd.append(binary_path)
+    cmd.extend(check_globs(app_path, config["globs"]))
     return cmd
 
 
@@ -214,7 +211,6 @@ async def sign_hardened_behavior(config, task, create_pkg=False, **kwargs):
     # sign apps concurrently
     for app in non_langpack_apps:
         for config_settings in hardened_sign_config:
-            check_globs(app.app_path, config_settings["globs"])
             command = build_sign_command(
                 app_path=app.app_path,
                 identity=sign_config["identity"],
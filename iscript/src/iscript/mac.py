@@ -9,29 +9,33 @@ import plistlib
 import re
 import shlex
 from copy import deepcopy
-from glob import glob
 from itertools import filterfalse
 from shutil import copy2
 
 import arrow
 import attr
-import pexpect
 
 from iscript.autograph import sign_langpacks, sign_omnija_with_autograph, sign_widevine_dir
 from iscript.exceptions import InvalidNotarization, IScriptError, ThrottledNotarization, TimeoutError, UnknownAppDir, UnknownNotarizationError
 from iscript.util import expand_globs, get_sign_config
 from scriptworker_client.aio import download_file, raise_future_exceptions, retry_async, semaphore_wrapper
 from scriptworker_client.exceptions import DownloadError
-from scriptworker_client.utils import get_artifact_path, makedirs, rm, run_command
+from scriptworker_client.utils import get_artifact_path, makedirs, rm, run_command, to_unicode
 
 log = logging.getLogger(__name__)
 
 
 KNOWN_ARTIFACT_PREFIXES = ("public/", "releng/partner/", "private/openh264/")
 
+# 32- and 64-bit thin, and fat, Mach-O magic numbers, in both byte orders.
+MACHO_MAGICS = frozenset(bytes.fromhex(magic) for magic in ("feedface", "cefaedfe", "feedfacf", "cffaedfe", "cafebabe", "bebafeca"))
+
+# The Contents/ subdirs where ``codesign --deep`` finds and signs nested code.
+DEEP_SIGN_DIRS = frozenset(("MacOS", "Frameworks", "Library", "PlugIns", "Helpers", "XPCServices"))
+
 
 # App {{{1
-@attr.s
+@attr.s(slots=True)
 class App(object):
     """Track the various paths related to each app.
 
@@ -44,10 +48,18 @@ class App(object):
             ``multi_account`` workflow.
         pkg_path (str): the unsigned .pkg path.
         pkg_name (str): the basename of the .pkg path.
+        tmp_pkg_path1 (str): the intermediate pkgbuild .pkg path.
+        tmp_pkg_path2 (str): the intermediate productbuild .pkg path.
         single_file_globs (list): the globs to sign in the mac_single_file behavior.
+        single_paths (list): the paths matching ``single_file_globs``, relative
+            to ``parent_dir``.
+        single_path (str): the single file to notarize in the mac_single_file
+            behavior.
         notarization_log_path (str): the path to the logfile for notarization,
             if we use the ``multi_account`` workflow. This is currently
             overwritten each time we poll.
+        notarization_uuid (str): the notarization request uuid, if we use the
+            ``multi_account`` workflow.
         target_bundle_path (str): the path inside of ``artifact_dir`` for the signed
             and notarized tarball or zip.
         target_pkg_path (str): the path inside of ``artifact_dir`` for the signed
@@ -63,8 +75,13 @@ class App(object):
     zip_path = attr.ib(default="")
     pkg_path = attr.ib(default="")
     pkg_name = attr.ib(default="")
+    tmp_pkg_path1 = attr.ib(default="")
+    tmp_pkg_path2 = attr.ib(default="")
     single_file_globs = attr.ib(default="")
+    single_paths = attr.ib(default="")
+    single_path = attr.ib(default="")
     notarization_log_path = attr.ib(default="")
+    notarization_uuid = attr.ib(default="")
     target_bundle_path = attr.ib(default="")
     target_pkg_path = attr.ib(default="")
     formats = attr.ib(default="")
@@ -81,7 +98,7 @@ class App(object):
 
         """
         for att in required_attrs:
-            if not hasattr(self, att) or not getattr(self, att):
+            if not getattr(self, att, None):
                 raise IScriptError("Missing {} attr!".format(att))
 
 
@@ -102,6 +119,12 @@ def _retry_run_cmd_semaphore(semaphore, cmd, cwd, exception=IScriptError):
     )
 
 
+def _get_fs_concurrency_limit(config):
+    # APFS serializes much of its filesystem work behind a kernel lock, so
+    # unbounded concurrent extraction or zipping only adds ``sys`` time.
+    return config.get("fs_concurrency_limit") or max(2, (os.cpu_count() or 1) * 2 // 3)
+
+
 # tar helpers {{{1
 def _get_tar_create_options(path):
     base_opts = "c"
@@ -240,22 +263,75 @@ async def sign_single_files(config, sign_config, all_paths):
             )
 
 
-async def _do_sign_file(top_dir, abs_file, file_, sign_command, app_path_len, app_executable):
+# _is_macho {{{1
+def _is_macho(path):
+    """Return ``True`` if ``path`` starts with a Mach-O magic number.
+
+    If we can't read ``path``, return ``True`` and let ``codesign`` decide.
+
+    """
+    try:
+        with open(path, "rb") as fh:
+            return fh.read(4) in MACHO_MAGICS
+    except OSError:
+        return True
+
+
+async def _do_sign_files(top_dir, files, sign_command, app_path_len, app_executable, batch_size=32):
     # Deal with inner .app's in sign_app, not here.
     if top_dir[app_path_len:].count(".app") > 0:
-        log.debug("Skipping %s because it's part of an inner app.", abs_file)
+        log.debug("Skipping %s because it's part of an inner app.", top_dir)
         return
     # app_executable gets signed with the outer package.
-    if file_ == app_executable:
-        log.debug("Skipping %s because it's the main executable.", abs_file)
-        return
-    dir_ = os.path.dirname(abs_file)
-    await retry_async(
-        run_command,
-        args=[sign_command + [file_]],
-        kwargs={"cwd": dir_, "exception": IScriptError, "output_log_on_exception": True},
-        retry_exceptions=(IScriptError,),
-    )
+    if app_executable in files:
+        log.debug("Skipping %s because it's the main executable.", os.path.join(top_dir, app_executable))
+        files = [file_ for file_ in files if file_ != app_executable]
+    # codesign accepts multiple paths, so sign up to ``batch_size`` files per process.
+    for i in range(0, len(files), batch_size):
+        await retry_async(
+            run_command,
+            args=[sign_command + files[i : i + batch_size]],
+            kwargs={"cwd": top_dir, "exception": IScriptError, "output_log_on_exception": True},
+            retry_exceptions=(IScriptError,),
+        )
+
+
+# _sign_app_deep {{{1
+async def _sign_app_deep(sign_config, app_path, entitlements_path):
+    """Try to sign the .app with a single ``codesign --deep`` call.
+
+    ``--deep`` signs all nested code with the same options, and only looks
+    for it in the standard nested code locations. So we only try this if
+    ``deep_sign`` is enabled, every entry in ``sign_dirs`` is in
+    ``DEEP_SIGN_DIRS``, and there are no ``skip_dirs`` or
+    ``hardened_runtime_only_files`` to honor. On failure, the caller should
+    fall back to signing each file.
+
+    Args:
+        sign_config (dict): the running config
+        app_path (str): the path to the app to be signed (extracted)
+        entitlements_path (str): the path to the entitlements file for signing
+
+    Returns:
+        bool: ``True`` if the app was signed, ``False`` otherwise.
+
+    """
+    if not sign_config.get("deep_sign") or sign_config.get("skip_dirs") or sign_config.get("hardened_runtime_only_files"):
+        return False
+    if not DEEP_SIGN_DIRS.issuperset(sign_config["sign_dirs"]):
+        # e.g. code under Contents/Resources would only be sealed as a resource
+        return False
+    parent_dir = os.path.dirname(app_path)
+    app_name = os.path.basename(app_path)
+    sign_command = _get_sign_command(sign_config["identity"], sign_config["signing_keychain"], sign_config, entitlements_path=entitlements_path)
+    # libclearkey isn't in a standard code location, so --deep won't find it.
+    await sign_libclearkey(os.path.join(app_path, "Contents"), sign_command, app_path)
+    try:
+        await run_command(sign_command + ["--deep", app_name], cwd=parent_dir, exception=IScriptError, output_log_on_exception=True)
+    except IScriptError:
+        log.warning("Deep signing %s failed; falling back to signing each file.", app_name)
+        return False
+    return True
 
 
 # sign_app {{{1
@@ -284,12 +360,31 @@ async def sign_app(sign_config, app_path, entitlements_path, provisioning_profil
 
     app_executable = get_bundle_executable(app_path)
     app_path_len = len(app_path)
+    batch_size = sign_config.get("codesign_batch_size", 32)
+    sign_macho_only = sign_config.get("sign_macho_only", False)
     contents_dir = os.path.join(app_path, "Contents")
+    hardened_runtime_only_files = sign_config.get("hardened_runtime_only_files", [])
+    # The sign command only varies by whether the file is in
+    # ``hardened_runtime_only_files``, so build each variant once.
+    sign_commands = {}
+
+    def is_runtime_only(file_):
+        # ``hardened_runtime_only_files`` may be a string, e.g. ``"geckodriver"``
+        return bool(file_) and file_ in hardened_runtime_only_files
+
+    def get_app_sign_command(file_=None):
+        runtime_only = is_runtime_only(file_)
+        if runtime_only not in sign_commands:
+            sign_commands[runtime_only] = _get_sign_command(identity, keychain, sign_config, file_=file_, entitlements_path=entitlements_path)
+        return sign_commands[runtime_only]
 
     if provisioning_profile_path:
         log.debug("inserting provisioning profile into app")
         copy2(provisioning_profile_path, os.path.join(contents_dir, "embedded.provisionprofile"))
 
+    if await _sign_app_deep(sign_config, app_path, entitlements_path):
+        return
+
     for top_dir, dirs, files in os.walk(contents_dir):
         for dir_ in dirs:
             abs_dir = os.path.join(top_dir, dir_)
@@ -306,26 +401,30 @@ async def sign_app(sign_config, app_path, entitlements_path, provisioning_profil
             if dir_.endswith(".framework"):
                 # Sign the entire .framework folder
                 #  codesign cannot determine if it's a Framework or an app bundle if signing the binary directly
-                sign_command = _get_sign_command(identity, keychain, sign_config, file_=dir_, entitlements_path=entitlements_path)
-                abs_file = os.path.join(top_dir, dir_)
-                await _do_sign_file(top_dir, abs_file, dir_, sign_command, app_path_len, app_executable)
+                await _do_sign_files(top_dir, [dir_], get_app_sign_command(dir_), app_path_len, app_executable)
                 continue
         if top_dir == contents_dir:
             log.debug("Skipping file iteration in %s because it's the root directory.", top_dir)
             continue
 
+        # Group the files by sign command, so we can sign them in batches.
+        files_by_command = {}
         for file_ in files:
-            abs_file = os.path.join(top_dir, file_)
-            sign_command = _get_sign_command(identity, keychain, sign_config, file_=file_, entitlements_path=entitlements_path)
-            await _do_sign_file(top_dir, abs_file, file_, sign_command, app_path_len, app_executable)
+            if sign_macho_only:
+                path = os.path.join(top_dir, file_)
+                if not _is_macho(path):
+                    log.debug("Skipping %s because it isn't a Mach-O file.", path)
+                    continue
+            files_by_command.setdefault(is_runtime_only(file_), []).append(file_)
+        for command_files in files_by_command.values():
+            await _do_sign_files(top_dir, command_files, get_app_sign_command(command_files[0]), app_path_len, app_executable, batch_size=batch_size)
 
-    await sign_libclearkey(contents_dir, _get_sign_command(identity, keychain, sign_config, entitlements_path=entitlements_path), app_path)
+    await sign_libclearkey(contents_dir, get_app_sign_command(), app_path)
 
     # sign bundle
-    sign_command = _get_sign_command(identity, keychain, sign_config, entitlements_path=entitlements_path)
     await retry_async(
         run_command,
-        args=[sign_command + [app_name]],
+        args=[get_app_sign_command() + [app_name]],
         kwargs={"cwd": parent_dir, "exception": IScriptError, "output_log_on_exception": True},
         retry_exceptions=(IScriptError,),
     )
@@ -388,22 +487,15 @@ async def unlock_keychain(signing_keychain, keychain_password):
 
     Raises:
         IScriptError: on failure
-        TimeoutFailure: on timeout
 
     """
     log.info("Unlocking signing keychain {}".format(signing_keychain))
-    child = pexpect.spawn("security", ["unlock-keychain", signing_keychain], encoding="utf-8")
-    try:
-        while True:
-            index = await child.expect([pexpect.EOF, r"password to unlock {}: ".format(signing_keychain)], async_=True)
-            if index == 0:
-                break
-            child.sendline(keychain_password)
-    except pexpect.exceptions.TIMEOUT as exc:
-        raise TimeoutError("Timeout trying to unlock the keychain {}: {}!".format(signing_keychain, exc)) from exc
-    child.close()
-    if child.exitstatus != 0 or child.signalstatus is not None:
-        raise IScriptError("Failed unlocking {}! exit {} signal {}".format(signing_keychain, child.exitstatus, child.signalstatus))
+    base_cmd = ["security", "unlock-keychain", "-p"]
+    await run_command(
+        base_cmd + [keychain_password, signing_keychain],
+        log_cmd=base_cmd + ["********", signing_keychain],
+        exception=IScriptError,
+    )
 
 
 async def update_keychain_search_path(config, signing_keychain):
@@ -435,6 +527,14 @@ async def update_keychain_search_path(config, signing_keychain):
 
 
 # get_app_dir {{{1
+def _scandir_visible(path):
+    try:
+        with os.scandir(path) as it:
+            return [entry for entry in it if not entry.name.startswith(".")]
+    except OSError:
+        return []
+
+
 def get_app_dir(parent_dir):
     """Get the .app directory in a ``parent_dir``.
 
@@ -448,7 +548,16 @@ def get_app_dir(parent_dir):
         UnknownAppDir: if there is no single app dir
 
     """
-    apps = glob("{}/*.app*".format(parent_dir)) + glob("{}/*/*.app*".format(parent_dir)) + glob("{}/*.systemextension*".format(parent_dir))
+    # This matches ``*.app*``, ``*/*.app*`` and ``*.systemextension*``, like
+    # ``glob`` would, without translating and matching patterns.
+    apps = []
+    entries = _scandir_visible(parent_dir)
+    for entry in entries:
+        if ".app" in entry.name or ".systemextension" in entry.name:
+            apps.append(entry.path)
+    for entry in entries:
+        if entry.is_dir():
+            apps.extend(sub_entry.path for sub_entry in _scandir_visible(entry.path) if ".app" in sub_entry.name)
     if len(apps) != 1:
         raise UnknownAppDir("Can't find a single .app in {}: {}".format(parent_dir, apps))
     return apps[0]
@@ -492,6 +601,17 @@ def get_langpack_format(app):
 
 
 # extract_all_apps {{{1
+def _recreate_dir(path):
+    rm(path)
+    makedirs(path)
+
+
+async def _extract_app(parent_dir, cmd):
+    # Clear out parent_dir in a thread, so the rm/mkdir for each app overlap.
+    await asyncio.get_running_loop().run_in_executor(None, _recreate_dir, parent_dir)
+    await run_command(cmd, cwd=parent_dir, exception=IScriptError, log_level=logging.DEBUG)
+
+
 async def extract_all_apps(config, all_paths):
     """Extract all the apps into their own directories.
 
@@ -505,40 +625,24 @@ async def extract_all_apps(config, all_paths):
     """
     log.info("Extracting all apps")
     futures = []
+    semaphore = asyncio.Semaphore(_get_fs_concurrency_limit(config))
     work_dir = config["work_dir"]
     unpack_dmg = os.path.join(os.path.dirname(__file__), "data", "unpack-diskimage")
+    extract_cmds = []
     for counter, app in enumerate(all_paths):
         app.check_required_attrs(["orig_path"])
         app.parent_dir = os.path.join(work_dir, str(counter))
-        rm(app.parent_dir)
-        makedirs(app.parent_dir)
         if app.orig_path.endswith((".tar.bz2", ".tar.gz", ".tgz")):
-            futures.append(
-                asyncio.ensure_future(
-                    run_command(
-                        ["tar", "xf", app.orig_path],
-                        cwd=app.parent_dir,
-                        exception=IScriptError,
-                        log_level=logging.DEBUG,
-                    )
-                )
-            )
+            extract_cmds.append(["tar", "xf", app.orig_path])
         elif app.orig_path.endswith(".dmg"):
             unpack_mountpoint = os.path.join("/tmp", f"{config.get('dmg_prefix', 'dmg')}-{counter}-unpack")
-            futures.append(
-                asyncio.ensure_future(
-                    run_command(
-                        [unpack_dmg, app.orig_path, unpack_mountpoint, app.parent_dir],
-                        cwd=app.parent_dir,
-                        exception=IScriptError,
-                        log_level=logging.DEBUG,
-                    )
-                )
-            )
+            extract_cmds.append([unpack_dmg, app.orig_path, unpack_mountpoint, app.parent_dir])
         elif app.orig_path.endswith(".zip"):
-            futures.append(asyncio.ensure_future(run_command(["unzip", app.orig_path], cwd=app.parent_dir, exception=IScriptError, log_level=logging.DEBUG)))
+            extract_cmds.append(["unzip", app.orig_path])
         else:
             raise IScriptError(f"unknown file type {app.orig_path}")
+    for app, cmd in zip(all_paths, extract_cmds):
+        futures.append(asyncio.ensure_future(semaphore_wrapper(semaphore, _extract_app(app.parent_dir, cmd))))
     await raise_future_exceptions(futures)
     if app.orig_path.endswith(".dmg"):
         # nuke the softlink to /Applications
@@ -546,28 +650,23 @@ async def extract_all_apps(config, all_paths):
             rm(os.path.join(app.parent_dir, " "))
 
 
-# create_all_notarization_zipfiles {{{1
-async def create_all_notarization_zipfiles(all_paths, path_attrs):
-    """Create notarization zipfiles for all the apps.
+# create_notarization_zipfile {{{1
+async def create_notarization_zipfile(app, path_attrs):
+    """Create the notarization zipfile for a single app.
 
     Args:
-        all_paths (list): list of ``App`` objects
+        app (App): the app to zip up
         path_attrs (list): list of path attributes to zip
 
     Raises:
         IScriptError: on failure
 
     """
-    futures = []
-    required_attrs = ["parent_dir"] + path_attrs
-    # zip up apps
-    for app in all_paths:
-        app.check_required_attrs(required_attrs)
-        parent_base_name = os.path.basename(app.parent_dir)
-        app.zip_path = f"{app.parent_dir}-upload{parent_base_name}.zip"
-        paths = [os.path.relpath(getattr(app, this_attr), app.parent_dir) for this_attr in path_attrs]
-        futures.append(asyncio.ensure_future(run_command(["zip", "-r", app.zip_path] + paths, cwd=app.parent_dir, exception=IScriptError)))
-    await raise_future_exceptions(futures)
+    app.check_required_attrs(["parent_dir"] + path_attrs)
+    parent_base_name = os.path.basename(app.parent_dir)
+    app.zip_path = f"{app.parent_dir}-upload{parent_base_name}.zip"
+    paths = [os.path.relpath(getattr(app, this_attr), app.parent_dir) for this_attr in path_attrs]
+    await run_command(["zip", "-r", app.zip_path] + paths, cwd=app.parent_dir, exception=IScriptError)
 
 
 # create_one_notarization_zipfile {{{1
@@ -625,6 +724,22 @@ async def sign_all_apps(config, sign_config, entitlements_path, all_paths, provi
 
     """
     log.info("Signing all apps")
+    await _sign_all_autograph_formats(config, sign_config, all_paths)
+    await unlock_keychain(sign_config["signing_keychain"], sign_config["keychain_password"])
+    futures = []
+    verify_semaphore = asyncio.Semaphore(_get_fs_concurrency_limit(config))
+
+    # sign apps concurrently, and verify each one as soon as it's signed
+    async def _sign_and_verify_app(app):
+        await sign_app(sign_config, app.app_path, entitlements_path, provisioning_profile_path)
+        await semaphore_wrapper(verify_semaphore, verify_app_signature(sign_config, app))
+
+    for app in all_paths:
+        futures.append(asyncio.ensure_future(_sign_and_verify_app(app)))
+    await raise_future_exceptions(futures)
+
+
+async def _sign_all_autograph_formats(config, sign_config, all_paths):
     for app in all_paths:
         set_app_path_and_name(app)
     # sign omni.ja
@@ -641,17 +756,6 @@ async def sign_all_apps(config, sign_config, entitlements_path, all_paths, provi
         if fmt:
             futures.append(asyncio.ensure_future(sign_widevine_dir(config, sign_config, app.app_path, fmt)))
     await raise_future_exceptions(futures)
-    await unlock_keychain(sign_config["signing_keychain"], sign_config["keychain_password"])
-    futures = []
-    # sign apps concurrently
-    for app in all_paths:
-        futures.append(asyncio.ensure_future(sign_app(sign_config, app.app_path, entitlements_path, provisioning_profile_path)))
-    await raise_future_exceptions(futures)
-    # verify signatures
-    futures = []
-    for app in all_paths:
-        futures.append(asyncio.ensure_future(verify_app_signature(sign_config, app)))
-    await raise_future_exceptions(futures)
 
 
 # get_bundle_id {{{1
@@ -672,12 +776,51 @@ def get_bundle_id(base_bundle_id, counter=None):
     return bundle_id
 
 
-# get_uuid_from_log {{{1
-def get_uuid_from_log(log_path):
-    """Get the UUID from the notarization log.
+# run_notarization_command {{{1
+async def run_notarization_command(cmd, log_path, log_cmd=None):
+    """Run a notarization command, and return its output.
+
+    Unlike ``run_command``, the output is kept in memory rather than written
+    to ``log_path``, so we can parse it without reading it back from disk.
+    We only write ``log_path`` on failure, for debugging.
+
+    Args:
+        cmd (list): the command to run
+        log_path (str): the path to write the output to on failure
+        log_cmd (list, optional): the command to log, if ``cmd`` contains
+            sensitive information. Defaults to ``cmd``.
+
+    Raises:
+        IScriptError: on non-zero exit
+
+    Returns:
+        str: the combined stdout and stderr of the command
+
+    """
+    log_cmd = log_cmd or cmd
+    log.info("Running {} ...".format(log_cmd))
+    proc = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, stdin=None, close_fds=True)
+    stdout, _ = await proc.communicate()
+    output = to_unicode(stdout)
+    if proc.returncode != 0:
+        with open(log_path, "w") as fh:
+            fh.write(output)
+        raise IScriptError("{} exited {}!\n{}".format(log_cmd, proc.returncode, output))
+    log.info("{} exited {}".format(log_cmd, proc.returncode))
+    return output
+
+
+# get_uuid_from_output {{{1
+def get_uuid_from_output(output, log_path):
+    """Get the UUID from the notarization request output.
+
+    If we can't find the UUID, we write ``output`` to ``log_path`` for
+    debugging.
 
     Args:
-        log_path (str): the path to the log
+        output (str): the output of the notarization request
+        log_path (str): the notarization log path for this request; used to
+            tell concurrent responses apart in the logs
 
     Raises:
         IScriptError: if we can't find the UUID
@@ -689,24 +832,20 @@ def get_uuid_from_log(log_path):
 
     """
     regex = re.compile(r"RequestUUID = (?P<uuid>[a-zA-Z0-9-]+)")
-    try:
-        with open(log_path, "r") as fh:
-            contents = fh.read()
-        log.info(f"{log_path} notarization response:\n{contents}")
-        exception = None
-        if "ERROR ITMS-10004" in contents:
-            exception = ThrottledNotarization
-        elif "ERROR " in contents:
-            exception = UnknownNotarizationError
-        if exception is not None:
-            raise exception(f"Error response from Apple!\n{contents}")
-        for line in contents.splitlines():
-            m = regex.search(line)
-            if m:
-                return m["uuid"]
-    except OSError as err:
-        raise IScriptError("Can't find UUID in {}: {}".format(log_path, err)) from err
-    raise IScriptError("Can't find UUID in {}!".format(log_path))
+    log.info(f"{log_path} notarization response:\n{output}")
+    exception = None
+    m = regex.search(output)
+    if "ERROR ITMS-10004" in output:
+        exception = ThrottledNotarization(f"Error response from Apple for {log_path}!\n{output}")
+    elif "ERROR " in output:
+        exception = UnknownNotarizationError(f"Error response from Apple for {log_path}!\n{output}")
+    elif m is None:
+        exception = IScriptError(f"Can't find UUID in {log_path} notarization response!")
+    if exception is not None:
+        with open(log_path, "w") as fh:
+            fh.write(output)
+        raise exception
+    return m["uuid"]
 
 
 # get_notarization_status_from_log {{{1
@@ -732,19 +871,102 @@ def get_notarization_status_from_log(log_path):
         pass
 
 
-# wrap_notarization_with_sudo {{{1
-async def wrap_notarization_with_sudo(config, sign_config, all_paths, path_attr="zip_path"):
-    """Wrap the notarization requests with sudo.
+# notarize_app_with_sudo {{{1
+def _get_notarization_account_queue(config):
+    account_queue = asyncio.Queue()
+    for account in config["local_notarization_accounts"]:
+        account_queue.put_nowait(account)
+    return account_queue
+
+
+async def notarize_app_with_sudo(sign_config, app, account_queue, counter, bundle_id):
+    """Submit a single app for notarization with sudo.
+
+    Apple creates a lockfile per user for notarization, so we take a local
+    account from ``account_queue`` for the duration of the request, and
+    return it when we're done.
+
+    Args:
+        sign_config (dict): the config for this signing key
+        app (App): the app to notarize
+        account_queue (asyncio.Queue): the queue of free local accounts
+        counter (int): the app's index, to keep the bundle id unique
+        bundle_id (str): the timestamped bundle id shared by all of the apps
+            we're notarizing; ``counter`` is appended to it.
+
+    Raises:
+        IScriptError: on failure
+
+    """
+    app.check_required_attrs(["zip_path", "parent_dir"])
+    app.notarization_log_path = f"{app.parent_dir}-notarization.log"
+    bundle_id = "{}.{}".format(bundle_id, counter)
+    base_cmdln = " ".join(
+        [
+            "xcrun",
+            "altool",
+            "--notarize-app",
+            "-f",
+            app.zip_path,
+            "--primary-bundle-id",
+            '"{}"'.format(bundle_id),
+            "-u",
+            sign_config["apple_notarization_account"],
+            "--asc-provider",
+            sign_config["apple_asc_provider"],
+            "--password",
+        ]
+    )
+    account = await account_queue.get()
+    try:
+        cmd = [
+            "sudo",
+            "su",
+            account,
+            "-c",
+            base_cmdln + " {}".format(shlex.quote(sign_config["apple_notarization_password"])),
+        ]
+        log_cmd = ["sudo", "su", account, "-c", base_cmdln + " ********"]
+        output = await retry_async(
+            run_notarization_command,
+            args=[cmd],
+            kwargs={"log_path": app.notarization_log_path, "log_cmd": log_cmd},
+            retry_exceptions=(IScriptError,),
+            attempts=10,
+        )
+    finally:
+        account_queue.put_nowait(account)
+    app.notarization_uuid = get_uuid_from_output(output, app.notarization_log_path)
 
-    Apple creates a lockfile per user for notarization. To notarize concurrently,
-    we use sudo against a set of accounts (``config['local_notarization_accounts']``).
+
+# sign_and_notarize_all_with_sudo {{{1
+async def _zip_and_notarize_app_with_sudo(sign_config, app, path_attrs, semaphore, account_queue, counter, bundle_id):
+    await semaphore_wrapper(semaphore, create_notarization_zipfile(app, path_attrs))
+    await notarize_app_with_sudo(sign_config, app, account_queue, counter, bundle_id)
+
+
+async def sign_and_notarize_all_with_sudo(
+    config, sign_config, entitlements_path, all_paths, provisioning_profile_path, path_attrs, requirements_plist_path=None
+):
+    """Sign, pkg, zip and submit each app for notarization with sudo.
+
+    This does the work of ``sign_all_apps`` and ``create_pkg_files``, then
+    zips and submits each app with ``notarize_app_with_sudo``. Each app moves
+    through the steps on its own, so one app can be notarizing while another
+    is still signing.
 
     Args:
         config (dict): the running config
         sign_config (dict): the config for this signing key
+        entitlements_path (str): the path to the entitlements file, used
+            for signing
         all_paths (list): the list of ``App`` objects
-        path_attr (str, optional): the attribute that the zip path is under.
-            Defaults to ``zip_path``
+        provisioning_profile_path (str): the path to a provisioning profile to insert
+                                         into the build prior to signing
+        path_attrs (list): list of path attributes to zip. If ``pkg_path`` is
+            in here, we create the pkg before zipping.
+        requirements_plist_path (str, optional): Path to a ``requirements.plist``
+            file to pass into productbuild. Defaults to ``None``.
 
     Raises:
         IScriptError: on failure
@@ -753,67 +975,39 @@ async def wrap_notarization_with_sudo(config, sign_config, all_paths, path_attr=
         dict: uuid to log path
 
     """
+    log.info("Signing and notarizing all apps")
+    await _sign_all_autograph_formats(config, sign_config, all_paths)
+    keychain_lock = asyncio.Lock()
+
+    async def _unlock_keychain():
+        # One ``security`` call at a time, even with several apps at the pkg step
+        async with keychain_lock:
+            await unlock_keychain(sign_config["signing_keychain"], sign_config["keychain_password"])
+            await update_keychain_search_path(config, sign_config["signing_keychain"])
+
+    await _unlock_keychain()
     futures = []
-    accounts = config["local_notarization_accounts"]
-    counter = 0
+    fs_semaphore = asyncio.Semaphore(_get_fs_concurrency_limit(config))
+    verify_semaphore = asyncio.Semaphore(_get_fs_concurrency_limit(config))
+    pkg_semaphore = asyncio.Semaphore(config.get("concurrency_limit", 2))
+    account_queue = _get_notarization_account_queue(config)
+    bundle_id = get_bundle_id(sign_config["base_bundle_id"])
     uuids = {}
 
+    async def _sign_and_notarize_app(counter, app):
+        await sign_app(sign_config, app.app_path, entitlements_path, provisioning_profile_path)
+        await semaphore_wrapper(verify_semaphore, verify_app_signature(sign_config, app))
+        if "pkg_path" in path_attrs:
+            # Unlock keychain again in case it's locked since previous unlock
+            await _unlock_keychain()
+            await create_pkg_files(config, sign_config, [app], requirements_plist_path=requirements_plist_path, semaphore=pkg_semaphore)
+        await _zip_and_notarize_app_with_sudo(sign_config, app, path_attrs, fs_semaphore, account_queue, counter, bundle_id)
+
+    for counter, app in enumerate(all_paths):
+        futures.append(asyncio.ensure_future(_sign_and_notarize_app(counter, app)))
+    await raise_future_exceptions(futures)
     for app in all_paths:
-        app.check_required_attrs([path_attr, "parent_dir"])
-
-    while counter < len(all_paths):
-        futures = []
-        for account in accounts:
-            app = all_paths[counter]
-            app.notarization_log_path = f"{app.parent_dir}-notarization.log"
-            bundle_id = get_bundle_id(sign_config["base_bundle_id"], counter=str(counter))
-            zip_path = getattr(app, path_attr)
-            # XXX potentially run the notarization + get_uuid_from_log in a
-            #     helper function per app, so we can retry them individually on
-            #     error. That would also let us record the path per UUID,
-            #     should we need that complexity later.
-            #     Not doing that now, so notarization errors are more visible.
-            base_cmdln = " ".join(
-                [
-                    "xcrun",
-                    "altool",
-                    "--notarize-app",
-                    "-f",
-                    zip_path,
-                    "--primary-bundle-id",
-                    '"{}"'.format(bundle_id),
-                    "-u",
-                    sign_config["apple_notarization_account"],
-                    "--asc-provider",
-                    sign_config["apple_asc_provider"],
-                    "--password",
-                ]
-            )
-            cmd = [
-                "sudo",
-                "su",
-                account,
-                "-c",
-                base_cmdln + " {}".format(shlex.quote(sign_config["apple_notarization_password"])),
-            ]
-            log_cmd = ["sudo", "su", account, "-c", base_cmdln + " ********"]
-            futures.append(
-                asyncio.ensure_future(
-                    retry_async(
-                        run_command,
-                        args=[cmd],
-                        kwargs={"log_path": app.notarization_log_path, "log_cmd": log_cmd, "exception": IScriptError},
-                        retry_exceptions=(IScriptError,),
-                        attempts=10,
-                    )
-                )
-            )
-            counter += 1
-            if counter >= len(all_paths):
-                break
-        await raise_future_exceptions(futures)
-    for app in all_paths:
-        uuids[get_uuid_from_log(app.notarization_log_path)] = app.notarization_log_path
+        uuids[app.notarization_uuid] = app.notarization_log_path
     return uuids
 
 
@@ -845,12 +1039,12 @@ async def notarize_no_sudo(work_dir, sign_config, zip_path):
         "--password",
     ]
     log_cmd = base_cmd + ["********"]
-    await retry_async(
-        run_command,
+    output = await retry_async(
+        run_notarization_command,
         args=[base_cmd + [sign_config["apple_notarization_password"]]],
-        kwargs={"log_path": notarization_log_path, "log_cmd": log_cmd, "exception": IScriptError},
+        kwargs={"log_path": notarization_log_path, "log_cmd": log_cmd},
     )
-    uuids = {get_uuid_from_log(notarization_log_path): notarization_log_path}
+    uuids = {get_uuid_from_output(output, notarization_log_path): notarization_log_path}
     return uuids
 
 
@@ -1001,7 +1195,7 @@ async def tar_apps(config, all_paths):
 
 
 # create_pkg_files {{{1
-async def create_pkg_files(config, sign_config, all_paths, requirements_plist_path=None):
+async def create_pkg_files(config, sign_config, all_paths, requirements_plist_path=None, semaphore=None):
     """Create .pkg installers from the .app files.
 
     Args:
@@ -1009,6 +1203,9 @@ async def create_pkg_files(config, sign_config, all_paths, requirements_plist_pa
         all_paths (list): the list of App objects to pkg
         requirements_plist_path (str): Path to a ``requirements.plist`` file
             to pass into productbuild (optional)
+        semaphore (asyncio.Semaphore, optional): the semaphore to limit
+            concurrent commands with. If ``None``, create one from
+            ``config["concurrency_limit"]``. Defaults to ``None``.
 
     Raises:
         IScriptError: on failure
@@ -1016,7 +1213,7 @@ async def create_pkg_files(config, sign_config, all_paths, requirements_plist_pa
     """
     log.info("Creating PKG files")
     futures = []
-    semaphore = asyncio.Semaphore(config.get("concurrency_limit", 2))
+    semaphore = semaphore or asyncio.Semaphore(config.get("concurrency_limit", 2))
     cmd_opts = []
     if sign_config.get("pkg_cert_id"):
         cmd_opts = ["--keychain", sign_config["signing_keychain"], "--sign", sign_config["pkg_cert_id"]]
@@ -1199,23 +1396,27 @@ async def notarize_behavior(config, task):
 
     # app
     await extract_all_apps(config, non_langpack_apps)
-    await unlock_keychain(sign_config["signing_keychain"], sign_config["keychain_password"])
-    await update_keychain_search_path(config, sign_config["signing_keychain"])
-    await sign_all_apps(config, sign_config, entitlements_path, non_langpack_apps, provisioning_profile_path)
-
-    # pkg
     if sign_config["create_pkg"]:
         path_attrs.append("pkg_path")
-        # Unlock keychain again in case it's locked since previous unlock
-        await unlock_keychain(sign_config["signing_keychain"], sign_config["keychain_password"])
-        await update_keychain_search_path(config, sign_config["signing_keychain"])
-        await create_pkg_files(config, sign_config, non_langpack_apps, requirements_plist_path=requirements_plist_path)
 
-    log.info("Notarizing")
     if sign_config["notarize_type"] == "multi_account":
-        await create_all_notarization_zipfiles(non_langpack_apps, path_attrs=path_attrs)
-        poll_uuids = await wrap_notarization_with_sudo(config, sign_config, non_langpack_apps, path_attr="zip_path")
+        # Sign, pkg and submit each app independently. This unlocks the keychain itself.
+        poll_uuids = await sign_and_notarize_all_with_sudo(
+            config, sign_config, entitlements_path, non_langpack_apps, provisioning_profile_path, path_attrs, requirements_plist_path=requirements_plist_path
+        )
     else:
+        await unlock_keychain(sign_config["signing_keychain"], sign_config["keychain_password"])
+        await update_keychain_search_path(config, sign_config["signing_keychain"])
+        await sign_all_apps(config, sign_config, entitlements_path, non_langpack_apps, provisioning_profile_path)
+
+        # pkg
+        if sign_config["create_pkg"]:
+            # Unlock keychain again in case it's locked since previous unlock
+            await unlock_keychain(sign_config["signing_keychain"], sign_config["keychain_password"])
+            await update_keychain_search_path(config, sign_config["signing_keychain"])
+            await create_pkg_files(config, sign_config, non_langpack_apps, requirements_plist_path=requirements_plist_path)
+
+        log.info("Notarizing")
         zip_path = await create_one_notarization_zipfile(work_dir, non_langpack_apps, sign_config, path_attrs=path_attrs)
         poll_uuids = await notarize_no_sudo(work_dir, sign_config, zip_path)
 
@@ -1265,23 +1466,27 @@ async def notarize_1_behavior(config, task):
 
     # app
     await extract_all_apps(config, non_langpack_apps)
-    await unlock_keychain(sign_config["signing_keychain"], sign_config["keychain_password"])
-    await update_keychain_search_path(config, sign_config["signing_keychain"])
-    await sign_all_apps(config, sign_config, entitlements_path, non_langpack_apps, provisioning_profile_path)
-
-    # pkg
     if sign_config["create_pkg"]:
         path_attrs.append("pkg_path")
-        # Unlock keychain again in case it's locked since previous unlock
-        await unlock_keychain(sign_config["signing_keychain"], sign_config["keychain_password"])
-        await update_keychain_search_path(config, sign_config["signing_keychain"])
-        await create_pkg_files(config, sign_config, non_langpack_apps, requirements_plist_path=requirements_plist_path)
 
-    log.info("Submitting for notarization.")
     if sign_config["notarize_type"] == "multi_account":
-        await create_all_notarization_zipfiles(non_langpack_apps, path_attrs=path_attrs)
-        poll_uuids = await wrap_notarization_with_sudo(config, sign_config, non_langpack_apps, path_attr="zip_path")
+        # Sign, pkg and submit each app independently. This unlocks the keychain itself.
+        poll_uuids = await sign_and_notarize_all_with_sudo(
+            config, sign_config, entitlements_path, non_langpack_apps, provisioning_profile_path, path_attrs, requirements_plist_path=requirements_plist_path
+        )
     else:
+        await unlock_keychain(sign_config["signing_keychain"], sign_config["keychain_password"])
+        await update_keychain_search_path(config, sign_config["signing_keychain"])
+        await sign_all_apps(config, sign_config, entitlements_path, non_langpack_apps, provisioning_profile_path)
+
+        # pkg
+        if sign_config["create_pkg"]:
+            # Unlock keychain again in case it's locked since previous unlock
+            await unlock_keychain(sign_config["signing_keychain"], sign_config["keychain_password"])
+            await update_keychain_search_path(config, sign_config["signing_keychain"])
+            await create_pkg_files(config, sign_config, non_langpack_apps, requirements_plist_path=requirements_plist_path)
+
+        log.info("Submitting for notarization.")
         zip_path = await create_one_notarization_zipfile(work_dir, non_langpack_apps, sign_config, path_attrs)
         poll_uuids = await notarize_no_sudo(work_dir, sign_config, zip_path)
 
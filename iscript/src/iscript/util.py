@@ -72,10 +72,10 @@ def get_sign_config(config, task, base_key="mac_config"):
 
     """
     try:
-        cert_type = task_cert_type(config, task)
+        key_config = _CERT_TYPE_TO_KEY_CONFIG[task_cert_type(config, task)]
         sign_config = deepcopy(PRODUCT_CONFIG[base_key][get_product(task)])
-        sign_config.update(config[base_key][_CERT_TYPE_TO_KEY_CONFIG[cert_type]])
-        sign_config["release_type"] = _CERT_TYPE_TO_KEY_CONFIG[cert_type]
+        sign_config.update(config[base_key][key_config])
+        sign_config["release_type"] = key_config
         return sign_config
     except KeyError as exc:
         raise IScriptError("get_sign_config error: {}".format(str(exc))) from exc
@@ -97,3 +97,28 @@ def expand_globs(globs, parent_dir=None):
         for path in glob.glob(path_glob, recursive=True):
             paths.append(os.path.relpath(path, start=parent_dir))
     return sorted(list(set(paths)))
+
+
+def iter_files(top):
+    """Lazily yield the path of every file under ``top``.
+
+    This uses an explicit ``os.scandir`` stack rather than building a list
+    of the whole tree, so callers can start processing before the walk
+    completes. As with ``os.walk``, symlinks to directories are neither
+    yielded nor descended into.
+
+    Args:
+        top (str): the directory to walk
+
+    Yields:
+        str: the path to each file under ``top``
+
+    """
+    stack = [top]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif not entry.is_dir():
+                    yield entry.path
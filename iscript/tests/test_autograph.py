@@ -303,7 +303,7 @@ async def test_omnija_autograph(mocker, tmp_path, sign_config, fmt, expected_url
         f.write("")
 
     merge = mocker.patch("iscript.autograph.merge_omnija_files")
-    merge.side_effect = lambda orig, signed, to: shutil.copy(signed, to)
+    merge.side_effect = lambda orig, signed, to, executor=None: shutil.copy(signed, to)
 
     async def fake_call(url, *args, **kwargs):
         assert expected_url in url
@@ -383,6 +383,40 @@ def test_get_omnija_signing_files(filenames, expected):
     assert autograph._get_omnija_signing_files(filenames) == expected
 
 
+@pytest.mark.asyncio
+async def test_sign_omnija_with_autograph_shared_executor(mocker, tmp_path):
+    """``sign_omnija_with_autograph`` merges every omni.ja in the app in one
+    executor, rather than spawning a process per file, and shuts it down
+    afterwards.
+
+    """
+    for dir_ in ("a", "b"):
+        os.makedirs(tmp_path / dir_)
+        with open(tmp_path / dir_ / "omni.ja", "w") as f:
+            f.write("")
+    executors = []
+
+    async def fake_merge(orig, signed, to, executor=None):
+        executors.append(executor)
+        shutil.copy(signed, to)
+
+    async def fake_sign(sign_config, from_, fmt, to, keyid, extension_id):
+        shutil.copy(from_, to)
+
+    mocker.patch.object(autograph, "merge_omnija_files", fake_merge)
+    mocker.patch.object(autograph, "sign_file_with_autograph", fake_sign)
+    pool = mocker.patch.object(autograph, "ProcessPoolExecutor")
+
+    config = {"work_dir": tmp_path}
+    await autograph.sign_omnija_with_autograph(config, {}, tmp_path / "a", "autograph_omnija")
+    await autograph.sign_omnija_with_autograph(config, {}, tmp_path, "autograph_omnija")
+    assert pool.call_count == 2
+    assert len(executors) == 3
+    assert executors[1] is executors[2] is pool.return_value
+    # Each executor is shut down when its call is done
+    assert pool.return_value.shutdown.call_count == 2
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize("orig", ("no_preload_unsigned_omni.ja", "preload_unsigned_omni.ja"))
 async def test_omnija_same(mocker, tmpdir, orig):
@@ -399,7 +433,8 @@ async def test_omnija_same(mocker, tmpdir, orig):
             return ["foobar", "baseball"]
 
     mocker.patch.object(autograph.zipfile, "ZipFile", mockedZipFile)
-    await autograph.merge_omnija_files(copy_from, "signed.ja", copy_to)
+    # Call the sync function directly, so the mock applies in this process
+    autograph._merge_omnija_files(copy_from, "signed.ja", copy_to)
     assert open(copy_from, "rb").read() == open(copy_to, "rb").read()
 
 
@@ -429,6 +464,14 @@ async def test_omnija_sign(tmpdir, mocker, orig, signed, sha256_expected):
     assert sha256_actual == sha256_expected
 
 
+@pytest.mark.asyncio
+async def test_merge_omnija_files(tmpdir):
+    """``merge_omnija_files`` merges in its own worker process if it isn't given an executor."""
+    merged = os.path.join(tmpdir, "merged.ja")
+    await autograph.merge_omnija_files(os.path.join(TEST_DATA_DIR, "preload_unsigned_omni.ja"), os.path.join(TEST_DATA_DIR, "preload_signed_omni.ja"), merged)
+    assert sha256(open(merged, "rb").read()).hexdigest() == "c353145c32cb3b251d65f85bcdba0c96d361292dad932b85d30f1dfe0b073e3f"
+
+
 def test_langpack_id_regex():
     assert autograph.LANGPACK_RE.match("langpack-en-CA@firefox.mozilla.org") is not None
     assert autograph.LANGPACK_RE.match("langpack-ja-JP-mac@devedition.mozilla.org") is not None
@@ -48,8 +48,10 @@ async def test_download_signing_resources(mocker):
 
 
 def test_check_globs():
-    globs = ["doesntexist/*", "/*"]
-    hs.check_globs(TEST_DATA_DIR, globs)
+    globs = ["doesntexist/*", "/*", "*.zip"]
+    paths = hs.check_globs(TEST_DATA_DIR, globs)
+    assert paths.count(os.path.join(TEST_DATA_DIR, "test.zip")) == 1
+    assert os.path.join(TEST_DATA_DIR, "example.pkg") in paths
 
 
 def test_copy_provisioning_profile(tmpdir):
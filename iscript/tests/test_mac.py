@@ -4,12 +4,10 @@
 import asyncio
 import os
 import plistlib
-from functools import partial
 from shutil import copy2
 
 import arrow
 import mock
-import pexpect
 import pytest
 from scriptworker_client.aio import retry_async
 from scriptworker_client.utils import makedirs
@@ -53,6 +51,20 @@ def test_app():
     a.check_required_attrs(["orig_path"])
     with pytest.raises(IScriptError):
         a.check_required_attrs(["app_path"])
+    # ``App`` is slotted, so typos raise rather than adding new attributes
+    with pytest.raises(AttributeError):
+        a.orig_pth = "foo"
+
+
+# _get_fs_concurrency_limit {{{1
+@pytest.mark.parametrize("config, cpu_count, expected", (({"fs_concurrency_limit": 5}, 12, 5), ({}, 12, 8), ({}, 1, 2), ({}, None, 2)))
+def test_get_fs_concurrency_limit(mocker, config, cpu_count, expected):
+    """``_get_fs_concurrency_limit`` prefers the config, falling back to
+    two thirds of the cpus, with a minimum of 2.
+
+    """
+    mocker.patch.object(os, "cpu_count", return_value=cpu_count)
+    assert mac._get_fs_concurrency_limit(config) == expected
 
 
 # tar helpers {{{1
@@ -154,9 +166,11 @@ def test_get_sign_command(sign_config, entitlements_path):
 
 
 # sign_app {{{1
-@pytest.mark.parametrize("sign_with_entitlements,has_clearkey,skip_dirs", ((True, True, tuple()), (False, False, ("foo.app",))))
+@pytest.mark.parametrize(
+    "sign_with_entitlements,has_clearkey,skip_dirs,deep_sign", ((True, True, tuple(), False), (False, False, ("foo.app",), True), (True, True, tuple(), True))
+)
 @pytest.mark.asyncio
-async def test_sign_app(mocker, tmpdir, sign_with_entitlements, has_clearkey, skip_dirs):
+async def test_sign_app(mocker, tmpdir, sign_with_entitlements, has_clearkey, skip_dirs, deep_sign):
     """Render ``sign_app`` noop and verify we have complete code coverage."""
     sign_config = {
         "identity": "id",
@@ -165,6 +179,7 @@ async def test_sign_app(mocker, tmpdir, sign_with_entitlements, has_clearkey, sk
         "designated_requirements": "",
         "sign_dirs": ("MacOS", "Library"),
         "skip_dirs": skip_dirs,
+        "deep_sign": deep_sign,
     }
     entitlements_path = os.path.join(tmpdir, "entitlements")
     app_path = os.path.join(tmpdir, "foo.app")
@@ -190,6 +205,178 @@ async def test_sign_app(mocker, tmpdir, sign_with_entitlements, has_clearkey, sk
     await mac.sign_app(sign_config, app_path, entitlements_path, "test")
 
 
+@pytest.mark.parametrize("sign_macho_only, expected", ((True, ["lib.dylib", "main2"]), (False, ["lib.dylib", "main2", "script.sh", "settings.ini"])))
+@pytest.mark.asyncio
+async def test_sign_app_macho_only(mocker, tmpdir, sign_macho_only, expected):
+    """``sign_app`` only signs Mach-O files if ``sign_macho_only`` is set."""
+    sign_config = {
+        "identity": "id",
+        "signing_keychain": "keychain",
+        "designated_requirements": "",
+        "sign_dirs": ("MacOS",),
+        "skip_dirs": tuple(),
+        "sign_macho_only": sign_macho_only,
+    }
+    app_path = os.path.join(tmpdir, "foo.app")
+    macos_dir = os.path.join(app_path, "Contents", "MacOS")
+    makedirs(macos_dir)
+    for name, contents in (
+        ("main", b"\xcf\xfa\xed\xfe"),
+        ("main2", b"\xca\xfe\xba\xbe"),
+        ("lib.dylib", b"\xcf\xfa\xed\xfe\x07\x00"),
+        ("script.sh", b"#!/bin/sh\n"),
+        ("settings.ini", b""),
+    ):
+        with open(os.path.join(macos_dir, name), "wb") as fh:
+            fh.write(contents)
+    signed = []
+
+    async def fake_retry_async(_, args, kwargs, **kw):
+        if kwargs["cwd"] == macos_dir:
+            signed.extend(args[0][args[0].index("--requirement") + 2 :])
+
+    mocker.patch.object(mac, "run_command", new=noop_async)
+    mocker.patch.object(mac, "retry_async", new=fake_retry_async)
+    mocker.patch.object(mac, "get_bundle_executable", return_value="main")
+    await mac.sign_app(sign_config, app_path, None)
+    assert sorted(signed) == expected
+
+
+@pytest.mark.parametrize("hardened_runtime_only_files", (["wg"], "wg"))
+@pytest.mark.asyncio
+async def test_sign_app_hardened_runtime_only_files(mocker, tmpdir, hardened_runtime_only_files):
+    """``sign_app`` builds each sign command once, and signs the
+    ``hardened_runtime_only_files`` without entitlements. The product config
+    may set ``hardened_runtime_only_files`` to a list or a single string.
+
+    """
+    sign_config = {
+        "identity": "id",
+        "signing_keychain": "keychain",
+        "designated_requirements": "",
+        "sign_with_entitlements": True,
+        "sign_dirs": ("MacOS", "Library"),
+        "skip_dirs": tuple(),
+        "hardened_runtime_only_files": hardened_runtime_only_files,
+    }
+    app_path = os.path.join(tmpdir, "foo.app")
+    for dir_ in ("MacOS", "Library"):
+        for name in ("main", "wg", "other"):
+            touch(os.path.join(app_path, "Contents", dir_, name))
+    calls = []
+    get_sign_command = mock.MagicMock(side_effect=mac._get_sign_command)
+
+    async def fake_retry_async(_, args, kwargs, **kw):
+        # Strip the identity, keychain and requirement
+        calls.append(args[0][8:])
+
+    mocker.patch.object(mac, "run_command", new=noop_async)
+    mocker.patch.object(mac, "retry_async", new=fake_retry_async)
+    mocker.patch.object(mac, "get_bundle_executable", return_value="main")
+    mocker.patch.object(mac, "_get_sign_command", new=get_sign_command)
+    await mac.sign_app(sign_config, app_path, "entitlements")
+    assert get_sign_command.call_count == 2
+    assert sorted(calls) == [
+        ["-o", "runtime", "--entitlements", "entitlements", "foo.app"],
+        ["-o", "runtime", "--entitlements", "entitlements", "other"],
+        ["-o", "runtime", "--entitlements", "entitlements", "other"],
+        ["-o", "runtime", "wg"],
+        ["-o", "runtime", "wg"],
+    ]
+
+
+# _is_macho {{{1
+@pytest.mark.parametrize(
+    "contents, expected",
+    (
+        (b"\xfe\xed\xfa\xce", True),
+        (b"\xce\xfa\xed\xfe", True),
+        (b"\xfe\xed\xfa\xcf", True),
+        (b"\xcf\xfa\xed\xfe\x07\x00\x00\x01", True),
+        (b"\xca\xfe\xba\xbe", True),
+        (b"\xbe\xba\xfe\xca", True),
+        (b"\x89PNG\r\n", False),
+        (b"\xcf\xfa", False),
+        (b"", False),
+        (None, True),
+    ),
+)
+def test_is_macho(tmpdir, contents, expected):
+    """``_is_macho`` checks for a Mach-O magic number, and defers to
+    ``codesign`` if the file can't be read.
+
+    """
+    path = os.path.join(tmpdir, "file")
+    if contents is not None:
+        with open(path, "wb") as fh:
+            fh.write(contents)
+    assert mac._is_macho(path) is expected
+
+
+# _sign_app_deep {{{1
+@pytest.mark.parametrize(
+    "extra_config, raises, expected",
+    (
+        ({"deep_sign": True}, False, True),
+        ({"deep_sign": True}, True, False),
+        ({"deep_sign": False}, False, False),
+        ({"deep_sign": True, "skip_dirs": ("foo.app",)}, False, False),
+        ({"deep_sign": True, "hardened_runtime_only_files": ["wg"]}, False, False),
+        ({"deep_sign": True, "sign_dirs": ("MacOS", "Frameworks", "Resources")}, False, False),
+    ),
+)
+@pytest.mark.asyncio
+async def test_sign_app_deep(mocker, tmpdir, extra_config, raises, expected):
+    """``_sign_app_deep`` signs the app with ``--deep`` when allowed, and
+    returns ``False`` if it isn't allowed or ``codesign`` fails.
+
+    """
+    sign_config = {"identity": "id", "signing_keychain": "keychain", "designated_requirements": "", "sign_dirs": ("MacOS", "Library", "Frameworks")}
+    sign_config.update(extra_config)
+    app_path = os.path.join(tmpdir, "foo.app")
+    calls = []
+
+    async def fake_run_command(cmd, **kwargs):
+        calls.append(cmd)
+        assert cmd[-2:] == ["--deep", "foo.app"]
+        assert kwargs["cwd"] == str(tmpdir)
+        if raises:
+            raise IScriptError("foo")
+
+    mocker.patch.object(mac, "run_command", new=fake_run_command)
+    mocker.patch.object(mac, "sign_libclearkey", new=noop_async)
+    assert await mac._sign_app_deep(sign_config, app_path, None) is expected
+    if not expected and not raises:
+        assert calls == []
+
+
+# _do_sign_files {{{1
+@pytest.mark.parametrize(
+    "top_dir, files, batch_size, expected",
+    (
+        ("foo.app/Contents/MacOS", ["a", "b", "main", "c"], 2, [["a", "b"], ["c"]]),
+        ("foo.app/Contents/MacOS", ["a", "b", "c"], 32, [["a", "b", "c"]]),
+        ("foo.app/Contents/MacOS", ["main"], 32, []),
+        ("foo.app/Contents/MacOS/inner.app/Contents/MacOS", ["a", "b"], 32, []),
+    ),
+)
+@pytest.mark.asyncio
+async def test_do_sign_files(mocker, top_dir, files, batch_size, expected):
+    """``_do_sign_files`` signs up to ``batch_size`` files per ``codesign``
+    call, skipping the main executable and inner apps.
+
+    """
+    calls = []
+
+    async def fake_retry_async(_, args, kwargs, **kw):
+        assert kwargs["cwd"] == top_dir
+        calls.append(args[0][1:])
+
+    mocker.patch.object(mac, "retry_async", new=fake_retry_async)
+    await mac._do_sign_files(top_dir, files, ["codesign"], len("foo.app"), "main", batch_size=batch_size)
+    assert calls == expected
+
+
 # verify_app_signature {{{1
 @pytest.mark.asyncio
 async def test_verify_app_signature_noop(mocker):
@@ -202,61 +389,42 @@ async def test_verify_app_signature_noop(mocker):
 
 
 # unlock_keychain {{{1
-def fake_spawn(val, *args, **kwargs):
-    return val
-
-
-@pytest.mark.parametrize("results", ([1, 0], [0]))
+@pytest.mark.parametrize("raises", (True, False))
 @pytest.mark.asyncio
-async def test_unlock_keychain_successful(results, mocker):
-    """Mock a successful keychain unlock."""
-
-    async def fake_expect(*args, **kwargs):
-        return results.pop(0)
-
-    child = mocker.Mock()
-    child.expect = fake_expect
-    child.exitstatus = 0
-    child.signalstatus = None
-    mocker.patch.object(pexpect, "spawn", new=partial(fake_spawn, child))
-    await mac.unlock_keychain("x", "y")
+async def test_unlock_keychain(mocker, raises):
+    """``unlock_keychain`` runs ``security unlock-keychain`` without logging
+    the password, and raises ``IScriptError`` on failure.
 
+    """
 
-@pytest.mark.asyncio
-async def test_unlock_keychain_timeout(mocker):
-    """``unlock_keychain`` raises a ``TimeoutError`` on pexpect timeout."""
-
-    async def fake_expect(*args, **kwargs):
-        raise pexpect.exceptions.TIMEOUT("foo")
-
-    child = mocker.Mock()
-    child.expect = fake_expect
-    child.exitstatus = 0
-    child.signalstatus = None
-    mocker.patch.object(pexpect, "spawn", new=partial(fake_spawn, child))
-    with pytest.raises(TimeoutError):
-        await mac.unlock_keychain("x", "y")
-
+    async def fake_run_command(cmd, **kwargs):
+        assert cmd == ["security", "unlock-keychain", "-p", "y", "x"]
+        assert kwargs["log_cmd"] == ["security", "unlock-keychain", "-p", "********", "x"]
+        if raises:
+            raise kwargs["exception"]("foo")
 
-@pytest.mark.asyncio
-async def test_unlock_keychain_failure(mocker):
-    """``unlock_keychain`` throws an ``IScriptError`` on non-zero exit status."""
-    results = [0]
-
-    async def fake_expect(*args, **kwargs):
-        return results.pop(0)
-
-    child = mocker.Mock()
-    child.expect = fake_expect
-    child.exitstatus = 1
-    child.signalstatus = None
-    mocker.patch.object(pexpect, "spawn", new=partial(fake_spawn, child))
-    with pytest.raises(IScriptError):
+    mocker.patch.object(mac, "run_command", new=fake_run_command)
+    if raises:
+        with pytest.raises(IScriptError):
+            await mac.unlock_keychain("x", "y")
+    else:
         await mac.unlock_keychain("x", "y")
 
 
 # get_app_dir {{{1
-@pytest.mark.parametrize("apps, raises", (([], True), (["foo.app"], False), (["foo.notanapp"], True), (["one.app", "two.app"], True)))
+@pytest.mark.parametrize(
+    "apps, raises",
+    (
+        ([], True),
+        (["foo.app"], False),
+        (["foo.notanapp"], True),
+        (["one.app", "two.app"], True),
+        (["sub/foo.app"], False),
+        (["foo.systemextension"], False),
+        ([".hidden.app"], True),
+        ([".hidden/foo.app"], True),
+    ),
+)
 def test_get_app_dir(tmpdir, apps, raises):
     """``get_app_dir`` returns the single ``.app`` dir in ``parent_dir``, and
     raises ``UnknownAppDir`` if there is greater or fewer than one ``.app``.
@@ -272,6 +440,12 @@ def test_get_app_dir(tmpdir, apps, raises):
         assert mac.get_app_dir(tmpdir) == os.path.join(tmpdir, apps[0])
 
 
+def test_get_app_dir_missing(tmpdir):
+    """``get_app_dir`` raises ``UnknownAppDir`` if ``parent_dir`` doesn't exist."""
+    with pytest.raises(UnknownAppDir):
+        mac.get_app_dir(os.path.join(tmpdir, "nonexistent"))
+
+
 # get_app_paths {{{1
 @pytest.mark.parametrize(
     "path, expected, raises", (("public/build/foo", "public/", False), ("releng/partner/bar", "releng/partner/", False), ("unknown/prefix/baz", None, True))
@@ -337,6 +511,7 @@ async def test_extract_all_apps(mocker, tmpdir, suffix, command, raises):
     mocker.patch.object(mac, "run_command", new=fake_run_command)
     work_dir = os.path.join(str(tmpdir), "work")
     config = {"work_dir": work_dir, "dmg_prefix": "test"}
+    touch(os.path.join(work_dir, "0", "stale"))
     all_paths = [
         mac.App(orig_path=os.path.join(work_dir, f"orig1.{suffix}")),
         mac.App(orig_path=os.path.join(work_dir, f"orig2.{suffix}")),
@@ -349,33 +524,31 @@ async def test_extract_all_apps(mocker, tmpdir, suffix, command, raises):
         await mac.extract_all_apps(config, all_paths)
         for i in ("0", "1", "2"):
             assert os.path.isdir(os.path.join(work_dir, i))
+        assert not os.path.exists(os.path.join(work_dir, "0", "stale"))
 
 
-# create_all_notarization_zipfiles {{{1
+# create_notarization_zipfile {{{1
 @pytest.mark.parametrize("raises", (True, False))
 @pytest.mark.asyncio
-async def test_create_all_notarization_zipfiles(mocker, tmpdir, raises):
-    """``create_all_notarization_zipfiles`` calls ``zip -r``, and raises on failure."""
+async def test_create_notarization_zipfile(mocker, tmpdir, raises):
+    """``create_notarization_zipfile`` calls ``zip -r``, and raises on failure."""
 
     async def fake_run_command(*args, **kwargs):
-        assert args[0][0:2] == ["zip", "-r"]
+        assert args[0] == ["zip", "-r", app.zip_path, "fx 0.app"]
+        assert kwargs["cwd"] == parent_dir
         if raises:
             raise IScriptError("foo")
 
     mocker.patch.object(mac, "run_command", new=fake_run_command)
-    all_paths = []
-    work_dir = str(tmpdir)
-    for i in range(3):
-        parent_dir = os.path.join(work_dir, str(i))
-        app_name = "fx {}.app".format(str(i))
-        app_path = os.path.join(parent_dir, app_name)
-        all_paths.append(mac.App(parent_dir=parent_dir, app_name=app_name, app_path=app_path))
+    parent_dir = os.path.join(str(tmpdir), "0")
+    app = mac.App(parent_dir=parent_dir, app_name="fx 0.app", app_path=os.path.join(parent_dir, "fx 0.app"))
 
     if raises:
         with pytest.raises(IScriptError):
-            await mac.create_all_notarization_zipfiles(all_paths, ["app_path"])
+            await mac.create_notarization_zipfile(app, ["app_path"])
     else:
-        await mac.create_all_notarization_zipfiles(all_paths, ["app_path"])
+        await mac.create_notarization_zipfile(app, ["app_path"])
+        assert app.zip_path == f"{parent_dir}-upload0.zip"
 
 
 # create_one_notarization_zipfile {{{1
@@ -425,6 +598,9 @@ async def test_sign_all_apps(mocker, tmpdir, raises):
         app_paths.append(app_path)
         all_paths.append(mac.App(parent_dir=os.path.join(work_dir, str(i)), app_path=app_path))
 
+    signed = []
+    verified = []
+
     async def fake_sign(arg1, arg2, arg3, arg4):
         assert arg1 == sign_config
         assert arg2 in app_paths
@@ -432,17 +608,24 @@ async def test_sign_all_apps(mocker, tmpdir, raises):
         assert arg4 == fake_provisioning_profile_path
         if raises:
             raise IScriptError("foo")
+        signed.append(arg2)
+
+    async def fake_verify_app_signature(sign_config, app):
+        assert app.app_path in signed
+        verified.append(app.app_path)
 
     mocker.patch.object(mac, "set_app_path_and_name", return_value=None)
     mocker.patch.object(mac, "sign_app", new=fake_sign)
     mocker.patch.object(mac, "unlock_keychain", new=noop_async)
-    mocker.patch.object(mac, "verify_app_signature", new=noop_async)
+    mocker.patch.object(mac, "verify_app_signature", new=fake_verify_app_signature)
     mocker.patch.object(mac, "sign_widevine_dir", new=noop_async)
     if raises:
         with pytest.raises(IScriptError):
             await mac.sign_all_apps(config, sign_config, entitlements_path, all_paths, fake_provisioning_profile_path)
+        assert verified == []
     else:
         await mac.sign_all_apps(config, sign_config, entitlements_path, all_paths, fake_provisioning_profile_path)
+        assert sorted(verified) == app_paths
 
 
 # get_bundle_id {{{1
@@ -461,13 +644,32 @@ def test_get_bundle_id(mocker, counter):
     assert mac.get_bundle_id(base, counter=counter) == expected
 
 
-# get_uuid_from_log {{{1
+# run_notarization_command {{{1
+@pytest.mark.parametrize("exit_code", (0, 1))
+@pytest.mark.asyncio
+async def test_run_notarization_command(tmpdir, exit_code):
+    """``run_notarization_command`` returns the command output, and only
+    writes it to ``log_path`` on failure.
+
+    """
+    log_path = os.path.join(str(tmpdir), "log")
+    cmd = ["bash", "-c", f"echo RequestUUID = foo; echo bar >&2; exit {exit_code}"]
+    if exit_code:
+        with pytest.raises(IScriptError):
+            await mac.run_notarization_command(cmd, log_path, log_cmd=["bash", "********"])
+        with open(log_path) as fh:
+            assert fh.read() == "RequestUUID = foo\nbar\n"
+    else:
+        assert await mac.run_notarization_command(cmd, log_path) == "RequestUUID = foo\nbar\n"
+        assert not os.path.exists(log_path)
+
+
+# get_uuid_from_output {{{1
 @pytest.mark.parametrize(
     "uuid, raises, extra",
     (
         ("07307e2c-db26-494c-8630-cfa239d4b86b", False, ""),
         ("d4d31c49-c075-4ea1-bb7f-150c74f608e1", False, "Blah blah blah\nFoo bar baz"),
-        ("d4d31c49-c075-4ea1-bb7f-150c74f608e1", "missing file", ""),
         ("%%%%\\\\=", "missing uuid", ""),
         (
             "07307e2c-db26-494c-8630-cfa239d4b86b",
@@ -477,23 +679,25 @@ def test_get_bundle_id(mocker, counter):
         ("d4d31c49-c075-4ea1-bb7f-150c74f608e1", UnknownNotarizationError, "What the! It looks like you've hit an ERROR of some sort"),
     ),
 )
-def test_get_uuid_from_log(tmpdir, uuid, raises, extra):
-    """``get_uuid_from_log`` returns the correct uuid from the logfile if present.
-    It raises if it has problems finding the uuid in the log.
+def test_get_uuid_from_output(tmpdir, uuid, raises, extra):
+    """``get_uuid_from_output`` returns the correct uuid from the output if present.
+    It raises if it has problems finding the uuid in the output, and writes
+    the output to ``log_path`` for debugging.
 
     """
     log_path = os.path.join(str(tmpdir), "log")
-    if raises != "missing file":
-        with open(log_path, "w") as fh:
-            fh.write(f"foo\nbar\nbaz\n RequestUUID = {uuid} \n{extra}\nblah\n")
+    output = f"foo\nbar\nbaz\n RequestUUID = {uuid} \n{extra}\nblah\n"
     if raises:
         exception = raises
         if not isinstance(raises, IScriptError):
             exception = IScriptError
         with pytest.raises(exception):
-            mac.get_uuid_from_log(log_path)
+            mac.get_uuid_from_output(output, log_path)
+        with open(log_path) as fh:
+            assert fh.read() == output
     else:
-        assert mac.get_uuid_from_log(log_path) == uuid
+        assert mac.get_uuid_from_output(output, log_path) == uuid
+        assert not os.path.exists(log_path)
 
 
 # get_notarization_status_from_log {{{1
@@ -513,17 +717,12 @@ def test_get_notarization_status_from_log(tmpdir, has_log, status, expected):
     assert mac.get_notarization_status_from_log(log_path) == expected
 
 
-# wrap_notarization_with_sudo {{{1
-@pytest.mark.parametrize("raises", (True, False))
-@pytest.mark.asyncio
-async def test_wrap_notarization_with_sudo(mocker, tmpdir, raises):
-    """``wrap_notarization_with_sudo`` chunks its requests into one concurrent
-    request per each of the ``local_notarization_accounts``. It doesn't log
-    the password.
+# notarize_app_with_sudo {{{1
+def _fake_sudo_notarization_retry_async(pw, raises, busy_accounts, used_accounts):
+    """Mock ``retry_async`` for sudo notarization, checking that each account
+    only runs one request at a time, and that we don't log the password.
 
     """
-    futures_len = [3, 3, 2]
-    pw = "test_apple_password"
 
     async def fake_retry_async(_, args, kwargs, **kw):
         cmd = args[0]
@@ -532,45 +731,166 @@ async def test_wrap_notarization_with_sudo(mocker, tmpdir, raises):
         log_cmd = kwargs["log_cmd"]
         assert cmd[0:end] == log_cmd[0:end]
         assert cmd[end] != log_cmd[end]
-        assert cmd[end] == pw
-        assert log_cmd[end].replace("*", "") == ""
-
-    async def fake_raise_future_exceptions(futures, **kwargs):
-        """``raise_future_exceptions`` mocker."""
-
-        await asyncio.wait(futures)
-        assert len(futures) == futures_len.pop(0)
+        assert cmd[end].endswith(pw)
+        assert pw not in log_cmd[end]
+        account = cmd[2]
+        assert account not in busy_accounts
+        busy_accounts.add(account)
+        used_accounts.append(account)
+        await asyncio.sleep(0)
+        busy_accounts.remove(account)
         if raises:
             raise IScriptError("foo")
+        return f"RequestUUID = uuid-{os.path.basename(kwargs['log_path']).split('-')[0]}"
+
+    return fake_retry_async
+
+
+@pytest.mark.parametrize("raises", (True, False))
+@pytest.mark.asyncio
+async def test_notarize_app_with_sudo(mocker, tmpdir, raises):
+    """``notarize_app_with_sudo`` runs at most one concurrent request per
+    each of the ``local_notarization_accounts``. It doesn't log the password,
+    and appends ``counter`` to the shared bundle id.
+
+    """
+    pw = "test_apple_password"
+    busy_accounts = set()
+    used_accounts = []
+    bundle_ids = []
+    fake_retry_async = _fake_sudo_notarization_retry_async(pw, raises, busy_accounts, used_accounts)
 
-    def fake_get_uuid_from_log(path):
-        return path
+    async def check_bundle_id_retry_async(func, args, kwargs, **kw):
+        bundle_ids.append(args[0][-1].split(" --primary-bundle-id ")[1].split(" ")[0])
+        return await fake_retry_async(func, args, kwargs, **kw)
 
     work_dir = str(tmpdir)
     config = {"local_notarization_accounts": ["acct0", "acct1", "acct2"]}
     sign_config = {
-        "base_bundle_id": "org.iscript.test",
         "apple_notarization_account": "test_apple_account",
         "apple_notarization_password": pw,
         "apple_asc_provider": "apple_asc_provider",
     }
+    account_queue = mac._get_notarization_account_queue(config)
     all_paths = []
-    expected = {}
-    # Let's create 8 apps, with 3 sudo accounts, so we expect batches of 3, 3, 2
+    # Let's create 8 apps, with 3 sudo accounts
     for i in range(8):
         parent_dir = os.path.join(work_dir, str(i))
-        notarization_log_path = f"{parent_dir}-notarization.log"
         all_paths.append(mac.App(parent_dir=parent_dir, zip_path=os.path.join(parent_dir, "{}.zip".format(i))))
-        expected[notarization_log_path] = notarization_log_path
 
-    mocker.patch.object(mac, "retry_async", new=fake_retry_async)
-    mocker.patch.object(mac, "raise_future_exceptions", new=fake_raise_future_exceptions)
-    mocker.patch.object(mac, "get_uuid_from_log", new=fake_get_uuid_from_log)
+    mocker.patch.object(mac, "retry_async", new=check_bundle_id_retry_async)
+    futures = [asyncio.ensure_future(mac.notarize_app_with_sudo(sign_config, app, account_queue, i, "org.iscript.test.1.2")) for i, app in enumerate(all_paths)]
+    if raises:
+        with pytest.raises(IScriptError):
+            await mac.raise_future_exceptions(futures)
+    else:
+        await mac.raise_future_exceptions(futures)
+        assert sorted(set(used_accounts)) == config["local_notarization_accounts"]
+        assert [app.notarization_uuid for app in all_paths] == [f"uuid-{i}" for i in range(8)]
+        assert [app.notarization_log_path for app in all_paths] == [os.path.join(work_dir, f"{i}-notarization.log") for i in range(8)]
+    assert len(used_accounts) == 8
+    # Every account is returned to the queue, even on failure
+    assert account_queue.qsize() == 3
+    assert sorted(bundle_ids) == sorted(f'"org.iscript.test.1.2.{i}"' for i in range(8))
+
+
+# sign_and_notarize_all_with_sudo {{{1
+@pytest.mark.parametrize("path_attrs, raises", ((["app_path"], False), (["app_path", "pkg_path"], False), (["app_path"], True)))
+@pytest.mark.asyncio
+async def test_sign_and_notarize_all_with_sudo(mocker, tmpdir, path_attrs, raises):
+    """``sign_and_notarize_all_with_sudo`` signs, verifies, optionally pkgs,
+    then zips and submits each app in order, with at most one concurrent
+    request per each of the ``local_notarization_accounts``. It raises on
+    failure.
+
+    """
+    pw = "test_apple_password"
+    busy_accounts = set()
+    used_accounts = []
+    steps = {}
+    fake_retry_async = _fake_sudo_notarization_retry_async(pw, False, busy_accounts, used_accounts)
+
+    async def fake_sign_app(sign_config, app_path, *args):
+        # The keychain is unlocked and added to the search path before any app starts
+        assert keychain_calls[:2] == ["unlock", "search_path"]
+        steps.setdefault(app_path, []).append("sign")
+        if raises:
+            raise IScriptError("foo")
+
+    async def fake_verify_app_signature(sign_config, app):
+        steps[app.app_path].append("verify")
+
+    async def fake_create_pkg_files(config, sign_config, all_paths, **kwargs):
+        assert len(all_paths) == 1
+        assert isinstance(kwargs["semaphore"], asyncio.Semaphore)
+        # ... and again before each pkg
+        assert keychain_calls[-2:] == ["unlock", "search_path"]
+        steps[all_paths[0].app_path].append("pkg")
+        all_paths[0].pkg_path = all_paths[0].app_path.replace(".app", ".pkg")
+
+    async def fake_run_command(cmd, **kwargs):
+        i = os.path.basename(kwargs["cwd"])
+        expected_paths = [f"{i}.app", f"{i}.pkg"] if "pkg_path" in path_attrs else [f"{i}.app"]
+        assert cmd == ["zip", "-r", f"{kwargs['cwd']}-upload{i}.zip"] + expected_paths
+        steps[os.path.join(kwargs["cwd"], f"{i}.app")].append("zip")
+
+    async def check_zipped_retry_async(func, args, kwargs, **kw):
+        zip_path = args[0][-1].split(" -f ")[1].split(" ")[0]
+        parent_dir = zip_path.split("-upload")[0]
+        steps[os.path.join(parent_dir, f"{os.path.basename(parent_dir)}.app")].append("notarize")
+        return await fake_retry_async(func, args, kwargs, **kw)
+
+    work_dir = str(tmpdir)
+    config = {"local_notarization_accounts": ["acct0", "acct1"]}
+    sign_config = {
+        "signing_keychain": "keychain",
+        "keychain_password": "password",
+        "base_bundle_id": "org.iscript.test",
+        "apple_notarization_account": "test_apple_account",
+        "apple_notarization_password": pw,
+        "apple_asc_provider": "apple_asc_provider",
+    }
+    all_paths = []
+    expected = {}
+    for i in range(3):
+        parent_dir = os.path.join(work_dir, str(i))
+        all_paths.append(mac.App(parent_dir=parent_dir, app_path=os.path.join(parent_dir, f"{i}.app"), formats=["macapp"]))
+        expected[f"uuid-{i}"] = f"{parent_dir}-notarization.log"
+
+    async def fake_unlock_keychain(*args):
+        keychain_calls.append("unlock")
+        await asyncio.sleep(0)
+
+    async def fake_update_keychain_search_path(*args):
+        keychain_calls.append("search_path")
+
+    keychain_calls = []
+    get_bundle_id = mock.MagicMock(side_effect=mac.get_bundle_id)
+    mocker.patch.object(mac, "unlock_keychain", new=fake_unlock_keychain)
+    mocker.patch.object(mac, "update_keychain_search_path", new=fake_update_keychain_search_path)
+    mocker.patch.object(mac, "sign_app", new=fake_sign_app)
+    mocker.patch.object(mac, "verify_app_signature", new=fake_verify_app_signature)
+    mocker.patch.object(mac, "create_pkg_files", new=fake_create_pkg_files)
+    mocker.patch.object(mac, "run_command", new=fake_run_command)
+    mocker.patch.object(mac, "retry_async", new=check_zipped_retry_async)
+    mocker.patch.object(mac, "get_bundle_id", new=get_bundle_id)
     if raises:
         with pytest.raises(IScriptError):
-            await mac.wrap_notarization_with_sudo(config, sign_config, all_paths)
+            await mac.sign_and_notarize_all_with_sudo(config, sign_config, "entitlements", all_paths, None, path_attrs)
+        assert list(steps.values()) == [["sign"]] * 3
+        assert used_accounts == []
     else:
-        assert await mac.wrap_notarization_with_sudo(config, sign_config, all_paths) == expected
+        assert await mac.sign_and_notarize_all_with_sudo(config, sign_config, "entitlements", all_paths, None, path_attrs) == expected
+        if "pkg_path" in path_attrs:
+            assert list(steps.values()) == [["sign", "verify", "pkg", "zip", "notarize"]] * 3
+        else:
+            assert list(steps.values()) == [["sign", "verify", "zip", "notarize"]] * 3
+        assert len(used_accounts) == 3
+    # One timestamped bundle id for the whole batch
+    get_bundle_id.assert_called_once_with("org.iscript.test")
+    # The keychain calls are serialized, so each unlock is followed by its search path update
+    num_unlocks = 4 if "pkg_path" in path_attrs and not raises else 1
+    assert keychain_calls == ["unlock", "search_path"] * num_unlocks
 
 
 # notarize_no_sudo {{{1
@@ -594,9 +914,7 @@ async def test_notarize_no_sudo(mocker, tmpdir, raises):
         assert log_cmd[end].replace("*", "") == ""
         if raises:
             raise IScriptError("foo")
-
-    def fake_get_uuid_from_log(path):
-        return path
+        return "RequestUUID = uuid"
 
     work_dir = str(tmpdir)
     zip_path = os.path.join(work_dir, "zip_path")
@@ -607,10 +925,9 @@ async def test_notarize_no_sudo(mocker, tmpdir, raises):
         "apple_notarization_password": pw,
         "apple_asc_provider": "apple_asc_provider",
     }
-    expected = {log_path: log_path}
+    expected = {"uuid": log_path}
 
     mocker.patch.object(mac, "retry_async", new=fake_retry_async)
-    mocker.patch.object(mac, "get_uuid_from_log", new=fake_get_uuid_from_log)
     if raises:
         with pytest.raises(IScriptError):
             await mac.notarize_no_sudo(work_dir, sign_config, zip_path)
@@ -1117,7 +1434,7 @@ async def test_notarize_behavior(mocker, tmpdir, notarize_type, use_langpack, cr
     mocker.patch.object(mac, "poll_notarization_uuid", new=noop_async)
     mocker.patch.object(mac, "get_app_dir", return_value=os.path.join(work_dir, "foo/bar.app"))
     mocker.patch.object(mac, "get_notarization_status_from_log", return_value=None)
-    mocker.patch.object(mac, "get_uuid_from_log", return_value="uuid")
+    mocker.patch.object(mac, "run_notarization_command", return_value="RequestUUID = uuid")
     mocker.patch.object(mac, "copy_pkgs_to_artifact_dir", new=noop_async)
     mocker.patch.object(mac, "get_sign_config", return_value=config["mac_config"]["dep"])
     mocker.patch.object(mac, "sign_widevine_dir", new=noop_async)
@@ -1175,7 +1492,7 @@ async def test_notarize_1_behavior(mocker, tmpdir, notarize_type, use_langpack,
     mocker.patch.object(mac, "unlock_keychain", new=noop_async)
     mocker.patch.object(mac, "get_bundle_executable", return_value="bundle_executable")
     mocker.patch.object(mac, "get_app_dir", return_value=os.path.join(work_dir, "foo/bar.app"))
-    mocker.patch.object(mac, "get_uuid_from_log", return_value="uuid")
+    mocker.patch.object(mac, "run_notarization_command", return_value="RequestUUID = uuid")
     mocker.patch.object(mac, "copy_pkgs_to_artifact_dir", new=noop_async)
     mocker.patch.object(mac, "get_sign_config", return_value=config["mac_config"]["dep"])
     mocker.patch.object(mac, "sign_widevine_dir", new=noop_async)
@@ -1286,7 +1603,7 @@ async def test_single_file_behavior(mocker, tmpdir, use_langpack, filename, form
             print(os.path.exists(os.path.join(app.parent_dir, filename)))
 
     mocker.patch.object(mac, "poll_notarization_uuid", new=noop_async)
-    mocker.patch.object(mac, "get_uuid_from_log", return_value="uuid")
+    mocker.patch.object(mac, "run_notarization_command", return_value="RequestUUID = uuid")
     mocker.patch.object(mac, "extract_all_apps", new=fake_extract)
     mocker.patch.object(mac, "run_command", new=noop_async)
     mocker.patch.object(mac, "unlock_keychain", new=noop_async)
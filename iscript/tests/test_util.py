@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # coding=utf-8
 """Test iscript.util"""
+import os
 from copy import deepcopy
 
 import pytest
@@ -36,3 +37,20 @@ def test_get_config_key(scopes, base_key, key, product, raises):
         expected.update(config[base_key][key])
         expected.update({"release_type": key})
         assert sign_config == expected
+
+
+# iter_files {{{1
+def test_iter_files(tmpdir):
+    """``iter_files`` yields every file, but doesn't follow directory symlinks."""
+    top = str(tmpdir)
+    expected = []
+    for path in ("a", "b/c", "b/d/e", "b/d/f/g"):
+        full_path = os.path.join(top, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "w") as fh:
+            fh.write(path)
+        expected.append(full_path)
+    os.symlink(os.path.join(top, "b", "d"), os.path.join(top, "linked_dir"))
+    os.symlink(os.path.join(top, "a"), os.path.join(top, "linked_file"))
+    expected.append(os.path.join(top, "linked_file"))
+    assert sorted(util.iter_files(top)) == sorted(expected)